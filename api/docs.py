@@ -1,11 +1,15 @@
 import codecs
+import gzip
+import hashlib
+import json
 import subprocess  # noqa
 from enum import Enum
+from functools import lru_cache
 from pathlib import Path
-from typing import List
+from typing import Dict, List, NamedTuple, Optional
 
-from fastapi import APIRouter, BackgroundTasks, HTTPException
-from fastapi.responses import HTMLResponse
+from fastapi import APIRouter, BackgroundTasks, Header, HTTPException
+from fastapi.responses import HTMLResponse, Response
 
 router = APIRouter()
 
@@ -13,6 +17,7 @@ CURRENT_DIR = Path(__file__).parent
 
 # I think the path below breaks on the server.
 # Perhaps we need: FILES_PATH = CURRENT_DIR / "api/docs/html"
+DOCS_PATH = CURRENT_DIR / "docs"
 FILES_PATH = CURRENT_DIR / "docs/html"
 MD_PATH = CURRENT_DIR / "docs/docs"
 # FILES_PATH = "api/docs/html"
@@ -57,6 +62,85 @@ def load_md_doc(device: DEVICE, type: str = "docs") -> str:
         raise HTTPException(status_code=500, detail="File not found") from e
 
 
+class BUNDLE_FORMAT(Enum):
+    """Enum for the formats included in the docs bundle"""
+
+    HTML = "html"
+    MD = "md"
+    ALL = "all"
+
+
+class DocsBundle(NamedTuple):
+    """Pre-built, gzip compressed docs bundle"""
+
+    etag: str
+    body: bytes
+
+
+def read_optional(path: str) -> Optional[str]:
+    """Read a file into memory, or return None if it does not exist"""
+    try:
+        with codecs.open(path, "r") as f:
+            content: str = f.read()
+            return content
+    except FileNotFoundError:
+        return None
+
+
+def read_git_ref(git_dir: Path, ref: str) -> Optional[str]:
+    """Resolve a ref (e.g. refs/heads/main) to a commit hash"""
+    loose = git_dir / ref
+    if loose.is_file():
+        return loose.read_text().strip()
+
+    # refs may also be packed, e.g. after a fresh clone
+    packed = git_dir / "packed-refs"
+    if packed.is_file():
+        for line in packed.read_text().splitlines():
+            if line.endswith(f" {ref}"):
+                return line.split()[0]
+    return None
+
+
+def docs_commit() -> str:
+    """Return the commit hash of the local DOC/FAQ repo checkout"""
+    # NOTE: read on every request, as any worker may have pulled new docs
+    git_dir = DOCS_PATH / ".git"
+    head = git_dir / "HEAD"
+    if head.is_file():
+        ref = head.read_text().strip()
+        commit = read_git_ref(git_dir, ref[5:]) if ref.startswith("ref: ") else ref
+        if commit:
+            return commit
+
+    # not a git checkout (e.g. a downloaded .zip): fingerprint the files instead
+    fingerprint = hashlib.sha1()  # noqa: S303
+    for path in sorted(DOCS_PATH.glob("**/*.*")):
+        fingerprint.update(f"{path}:{path.stat().st_mtime_ns}".encode())
+    return fingerprint.hexdigest()
+
+
+@lru_cache(maxsize=len(BUNDLE_FORMAT) * 2)
+def build_bundle(commit: str, format: BUNDLE_FORMAT) -> DocsBundle:
+    """Collect all docs and FAQs into one compressed JSON document"""
+    # NOTE: commit is only used as cache key, a new commit builds a new bundle
+    docs: Dict[str, Dict[str, Optional[str]]] = {}
+    for device in DEVICE:
+        entry: Dict[str, Optional[str]] = {}
+        if format in (BUNDLE_FORMAT.HTML, BUNDLE_FORMAT.ALL):
+            entry["docs"] = read_optional(f"{FILES_PATH}/docs/{device.name}.html")
+            entry["faq"] = read_optional(f"{FILES_PATH}/faq/{device.name}.html")
+        if format in (BUNDLE_FORMAT.MD, BUNDLE_FORMAT.ALL):
+            entry["md"] = read_optional(f"{MD_PATH}/{device.name}.md")
+        docs[device.name] = entry
+
+    payload = json.dumps({"commit": commit, "docs": docs}, separators=(",", ":"))
+    return DocsBundle(
+        etag=f'"{commit}-{format.value}"',
+        body=gzip.compress(payload.encode("utf-8")),
+    )
+
+
 def retrieve_latest_docs() -> None:
     """Run shell script to pull latest changes to the DOC/FAQ repo"""
     subprocess.run(["git", "-C", "api/docs/", "pull"])  # noqa
@@ -75,6 +159,37 @@ def list_devices() -> List[str]:
     return [d.name for d in DEVICE]
 
 
+def etag_matches(etag: str, if_none_match: str) -> bool:
+    """Check an If-None-Match header against an ETag, using weak comparison"""
+    # NOTE: proxies (e.g. nginx when compressing) may weaken the ETag to W/"..."
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return any(
+        tag == "*" or (tag[2:] if tag.startswith("W/") else tag) == etag for tag in tags
+    )
+
+
+@router.get("/bundle", response_class=Response)
+def bundle(
+    format: BUNDLE_FORMAT = BUNDLE_FORMAT.ALL,
+    if_none_match: Optional[str] = Header(None),  # noqa: B008
+    accept_encoding: Optional[str] = Header(None),  # noqa: B008
+) -> Response:
+    """Get all docs and FAQs in one request, e.g. to preload the dashboard"""
+    docs = build_bundle(docs_commit(), format)
+    headers = {"ETag": docs.etag, "Vary": "Accept-Encoding"}
+
+    if if_none_match and etag_matches(docs.etag, if_none_match):
+        return Response(status_code=304, headers=headers)
+
+    if accept_encoding and "gzip" in accept_encoding:
+        headers["Content-Encoding"] = "gzip"
+        return Response(docs.body, media_type="application/json", headers=headers)
+
+    return Response(
+        gzip.decompress(docs.body), media_type="application/json", headers=headers
+    )
+
+
 @router.get("/{device}", response_class=HTMLResponse)
 def device(device: DEVICE) -> str:
     """Get information about the device documentation"""
@@ -1,11 +1,112 @@
+from typing import Optional
+
 from fastapi import FastAPI
 
+from api.docs import BUNDLE_FORMAT, build_bundle, docs_commit
 from api.docs import router as docs
 from api.patients import router as patients
 from api.pipeline import router as pipeline
+from api.profiles import router as profiles
+from api.settings import Settings, configure
+from api.utils.admission import AdaptiveLimiter, AdmissionControl
+from api.utils.airflow import airflow_session
+from api.utils.analytics import HISTORY
+from api.utils.coverage import coverage_stats
+from api.utils.db import close_mongo_client, mongo_client
+from api.utils.profiling import ProfileStore, Profiling, profile_endpoints
+from api.utils.startup import StartupReport
+from api.utils.streaming import JSONGZip
+from api.utils.ucam import fetch_roster, ucam_login, ucam_session
+
+
+def create_app(settings: Optional[Settings] = None) -> FastAPI:
+    """Create the API; subsystems are set up on startup or on first use"""
+    report = StartupReport()
+
+    with report.stage("settings"):
+        settings = configure(settings or Settings())
+        # drop subsystems set up, and results cached, with previous settings
+        close_mongo_client()
+        for cached in (
+            airflow_session,
+            ucam_session,
+            ucam_login,
+            fetch_roster,
+            coverage_stats,
+            build_bundle,
+        ):
+            cached.cache_clear()
+        HISTORY.clear()
+
+    with report.stage("routers"):
+        app = FastAPI(docs_url="/swagger", redoc_url="/redoc")
+
+        app.include_router(patients, prefix="/patients")
+        app.include_router(docs, prefix="/docs")
+        app.include_router(pipeline, prefix="/status")
+        app.include_router(profiles, prefix="/profiles", include_in_schema=False)
+
+    with report.stage("middleware"):
+        app.add_middleware(JSONGZip, minimum_size=1000)
+
+        # NOTE: keep the sum of max_limit below the worker threadpool size (40), so
+        # cheap local routes (e.g. /docs) always have threads available
+        app.add_middleware(
+            AdmissionControl,
+            groups={
+                # UCAM (and the credentials database)
+                "/patients": AdaptiveLimiter(
+                    min_limit=2,
+                    max_limit=16,
+                    max_queue=32,
+                    max_wait=10,
+                    target_latency=2,
+                ),
+                # Apache Airflow
+                "/status": AdaptiveLimiter(
+                    min_limit=1,
+                    max_limit=8,
+                    max_queue=16,
+                    max_wait=10,
+                    target_latency=5,
+                ),
+            },
+        )
+
+        app.state.profiles = ProfileStore(
+            settings.profiling_dir, settings.profiling_keep
+        )
+        # NOTE: only added when enabled, to add no overhead otherwise. Without a
+        # token, (sampled) profiles could not be downloaded, so it is required
+        if settings.profiling_token:
+            profile_endpoints(app)
+            app.add_middleware(
+                Profiling,
+                store=app.state.profiles,
+                token=settings.profiling_token,
+                sample_rate=settings.profiling_sample_rate,
+                interval=settings.profiling_interval,
+            )
+
+    app.state.settings = settings
+    app.state.startup_report = report
+
+    @app.on_event("startup")
+    def startup() -> None:
+        """Set up local subsystems; UCAM and Airflow connect on first request"""
+        with report.stage("mongo"):
+            # NOTE: connects in the background, does not wait for the server
+            mongo_client()
+        with report.stage("docs"):
+            build_bundle(docs_commit(), BUNDLE_FORMAT.ALL)
+        report.log()
+
+    @app.on_event("shutdown")
+    def shutdown() -> None:
+        """Close open connections"""
+        close_mongo_client()
+
+    return app
 
-api = FastAPI(docs_url="/swagger", redoc_url="/redoc")
 
-api.include_router(patients, prefix="/patients")
-api.include_router(docs, prefix="/docs")
-api.include_router(pipeline, prefix="/status")
+api = create_app()
@@ -1,11 +1,21 @@
 import operator
 from enum import Enum
-from typing import List, Optional
+from typing import Dict, List, Optional, Union
 
-from fastapi import APIRouter, Query
+from fastapi import APIRouter, Body, Header, Query
+from fastapi.responses import StreamingResponse
 
+from api.utils.coverage import GROUPBY, DeviceCoverage, coverage_stats
 from api.utils.db import PatientsCredentials, get_patients_credentials
-from api.utils.ucam import PatientWithDevices, get_one_patient, get_patients
+from api.utils.streaming import ndjson_response, wants_ndjson
+from api.utils.ucam import (
+    PatientsBatch,
+    PatientWithDevices,
+    get_many_patients,
+    get_one_patient,
+    get_roster,
+    iter_patients,
+)
 
 router = APIRouter()
 
@@ -23,17 +33,45 @@ class ORDER(Enum):
 def patients(
     cohort: Optional[str] = Query(None, max_length=1, regex="[A-Z]"),  # noqa: B008
     orderby: Optional[ORDER] = None,
-) -> Optional[List[PatientWithDevices]]:
-    """Get a list of known patients"""
-    patients = get_patients()
+    accept: Optional[str] = Header(None),  # noqa: B008
+) -> Union[Optional[List[PatientWithDevices]], StreamingResponse]:
+    """Get a list of known patients, streamed as NDJSON if accepted"""
+    patients = iter_patients()
 
     if cohort:
-        patients = [p for p in patients if p.patient_id[0] == cohort]
+        patients = (p for p in patients if p.patient_id[0] == cohort)
 
     if orderby:
-        patients = sorted(patients, key=operator.attrgetter(orderby.value))
+        patients = iter(sorted(patients, key=operator.attrgetter(orderby.value)))
 
-    return patients
+    if wants_ndjson(accept):
+        return ndjson_response(patients)
+
+    # NOTE: no patients at all is None, a filter without matches []
+    found = list(patients)
+    return found if found or cohort else None
+
+
+@router.get("/stats", response_model=Dict[str, Dict[str, DeviceCoverage]])
+def patients_stats(
+    groupby: GROUPBY = GROUPBY.COHORT,
+) -> Dict[str, Dict[str, DeviceCoverage]]:
+    """Get device wear-time coverage per cohort or disease, and device type"""
+    return coverage_stats(get_roster().version, groupby)
+
+
+@router.get("/batch", response_model=PatientsBatch)
+def many_patients(
+    ids: List[str] = Query(...),  # noqa: B008
+) -> PatientsBatch:
+    """Get details about many patients at once, IDs repeated or comma separated"""
+    return get_many_patients([id for param in ids for id in param.split(",") if id])
+
+
+@router.post("/batch", response_model=PatientsBatch)
+def many_patients_post(ids: List[str] = Body(...)) -> PatientsBatch:  # noqa: B008
+    """Get details about many patients at once, for long lists of IDs"""
+    return get_many_patients(ids)
 
 
 @router.get("/credentials/{id}", response_model=PatientsCredentials)
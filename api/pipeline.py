@@ -1,6 +1,7 @@
-from typing import Dict, List, Optional
+from typing import Dict, Iterator, List, Optional, Union
 
-from fastapi import APIRouter
+from fastapi import APIRouter, Header, HTTPException, Query
+from fastapi.responses import StreamingResponse
 
 from api.utils.airflow import (
     PipelineHealth,
@@ -9,8 +10,17 @@ from api.utils.airflow import (
     get_airflow,
     get_all_dag_dagruns,
     get_dag_dagruns,
+    iter_dag_dagruns,
     update_run_health,
 )
+from api.utils.analytics import (
+    HISTORY,
+    MAX_WINDOW_DAYS,
+    MAX_WINDOWS,
+    PipelineAnalytics,
+    pipeline_analytics,
+)
+from api.utils.streaming import ndjson_response, wants_ndjson
 
 router = APIRouter()
 
@@ -54,11 +64,24 @@ def get_dag_run_list_with_schedules() -> Dict[str, Optional[str]]:
     }
 
 
+def iter_dag_run_history(dag_ids: List[str]) -> Iterator[dict]:
+    """Evaluate all runs one by one, labelled with their dag_id"""
+    for dag_id in dag_ids:
+        for run in iter_dag_dagruns(dag_id):
+            update_run_health(dag_id, run)
+            yield {"dag_id": dag_id, **run.dict()}
+
+
 @router.get("/history", response_model=Dict[str, List[PipelineRun]])
-def get_dag_run_status_historically() -> dict:
-    """Get the history of all pipeline runs"""
+def get_dag_run_status_historically(
+    accept: Optional[str] = Header(None),  # noqa: B008
+) -> Union[dict, StreamingResponse]:
+    """Get the history of all pipeline runs, streamed as NDJSON if accepted"""
     dag_ids = get_dag_run_list_with_schedules()
 
+    if wants_ndjson(accept):
+        return ndjson_response(iter_dag_run_history(list(dag_ids.keys())))
+
     # just focusing on the latest run
     all_runs = {id: get_all_dag_dagruns(id) for id in dag_ids.keys()}
 
@@ -68,3 +91,27 @@ def get_dag_run_status_historically() -> dict:
             update_run_health(dag_id, run)
 
     return all_runs
+
+
+@router.get("/analytics", response_model=Dict[str, List[PipelineAnalytics]])
+def get_dag_run_analytics(
+    windows: List[int] = Query([7, 30, 90]),  # noqa: B008
+) -> dict:
+    """Get success rates, durations and failing tasks per pipeline over rolling windows"""
+    if len(windows) > MAX_WINDOWS or not all(
+        1 <= days <= MAX_WINDOW_DAYS for days in windows
+    ):
+        raise HTTPException(
+            status_code=422,
+            detail=f"Up to {MAX_WINDOWS} windows of 1 to {MAX_WINDOW_DAYS} days",
+        )
+
+    dag_ids = get_dag_run_list_with_schedules()
+
+    # only runs that are new since the previous request are fetched from Airflow
+    all_runs = {id: HISTORY.sync(id) for id in dag_ids.keys()}
+
+    return {
+        id: [pipeline_analytics(runs, days) for days in windows]
+        for id, runs in all_runs.items()
+    }
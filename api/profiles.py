@@ -0,0 +1,52 @@
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Path, Request
+from fastapi.responses import PlainTextResponse
+
+from api.settings import get_settings
+from api.utils.profiling import ProfileDetails, ProfileStore, ProfileSummary, authorised
+
+# profile IDs are uuid4 hex strings, which also keeps IDs from escaping the store
+PROFILE_ID = Path(..., regex="^[0-9a-f]{32}$")  # noqa: B008
+
+
+def admin_only(x_profile_token: Optional[str] = Header(None)) -> None:  # noqa: B008
+    """Only allow requests with the profiling token"""
+    if not authorised(get_settings().profiling_token, x_profile_token):
+        raise HTTPException(status_code=403, detail="Invalid profiling token")
+
+
+router = APIRouter(dependencies=[Depends(admin_only)])
+
+
+def profile_store(request: Request) -> ProfileStore:
+    """Get the profiles stored by the profiling middleware (of any worker)"""
+    store: ProfileStore = request.app.state.profiles
+    return store
+
+
+def find_profile(request: Request, id: str) -> ProfileDetails:
+    """Get a stored profile, or a 404 if it is unknown or dropped"""
+    profile = profile_store(request).get(id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return profile
+
+
+@router.get("/", response_model=List[ProfileSummary])
+def list_profiles(request: Request) -> List[ProfileSummary]:
+    """List the last profiled requests, newest first"""
+    return [ProfileSummary(**p.dict()) for p in profile_store(request).all()]
+
+
+@router.get("/{id}", response_model=ProfileDetails)
+def one_profile(request: Request, id: str = PROFILE_ID) -> ProfileDetails:
+    """Get upstream timings and sampled stacks of a profiled request"""
+    return find_profile(request, id)
+
+
+@router.get("/{id}/stacks", response_class=PlainTextResponse)
+def one_profile_stacks(request: Request, id: str = PROFILE_ID) -> str:
+    """Download sampled stacks in collapsed format, e.g. for speedscope.app"""
+    stacks = find_profile(request, id).stacks
+    return "\n".join(f"{stack} {n}" for stack, n in stacks.items())
@@ -0,0 +1,59 @@
+from pathlib import Path
+from tempfile import gettempdir
+from typing import Optional
+
+from pydantic import BaseSettings, Field, PositiveInt
+
+
+class Settings(BaseSettings):
+    """Typed configuration, read from the environment and the .env file"""
+
+    # IDEAFAST-ETL access settings
+    airflow_server: str = "airflow-webserver"
+    airflow_pass: Optional[str] = Field(None, env="WP3API_AIRFLOW_PASS")
+
+    # UCAM API
+    ucam_uri: str = ""
+    ucam_username: Optional[str] = None
+    ucam_password: Optional[str] = None
+    ucam_roster_ttl: PositiveInt = 300  # seconds to cache the list of patients for
+
+    # patient credentials database
+    mongo_host: str = Field("mongo_credentials", env="_MONGO_INITDB_HOST")
+    mongo_port: int = Field(27017, env="_MONGO_INITDB_PORT")
+    mongo_username: Optional[str] = Field(None, env="_MONGO_INITDB_ROOT_USERNAME")
+    mongo_password: Optional[str] = Field(None, env="_MONGO_INITDB_ROOT_PASSWORD")
+    mongo_database: str = Field("patient_credentials", env="_MONGO_INITDB_DATABASE")
+    mongo_collection: str = Field("credentials", env="_MONGO_INITDB_COLLECTION")
+
+    # on-demand profiling, disabled without a token
+    profiling_token: Optional[str] = None
+    profiling_sample_rate: float = 0.0  # fraction of requests to profile anyway
+    profiling_interval: float = 0.005  # seconds between stack samples
+    profiling_keep: int = 20  # number of profiles to keep
+    # shared by all workers, so any worker can serve any profile
+    profiling_dir: Path = Path(gettempdir()) / "wp3api-profiles"
+
+    class Config:
+        """Settings configuration"""
+
+        env_file = ".env"
+
+
+# NOTE: set by create_app, or read from the environment on first use
+_settings: Optional[Settings] = None
+
+
+def get_settings() -> Settings:
+    """Get the settings the API was created with"""
+    global _settings
+    if _settings is None:
+        _settings = Settings()
+    return _settings
+
+
+def configure(settings: Settings) -> Settings:
+    """Use these settings for all subsystems"""
+    global _settings
+    _settings = settings
+    return settings
@@ -0,0 +1,151 @@
+import asyncio
+import math
+from collections import deque
+from contextvars import ContextVar
+from typing import Any, Callable, Deque, Dict, Optional
+
+from fastapi.responses import JSONResponse
+
+
+class AdaptiveLimiter:
+    """Concurrency limit with a bounded wait queue for one group of routes
+
+    The limit shrinks when the (smoothed) latency of the upstream calls made
+    by the group exceeds the target latency, e.g. when UCAM slows down, and
+    slowly grows back to `max_limit` once latency recovers. The duration of
+    whole requests is not used, as streamed or long scanning requests (e.g.
+    /status/history) are slow even when the upstream service is healthy.
+    """
+
+    def __init__(
+        self,
+        min_limit: int,
+        max_limit: int,
+        max_queue: int,
+        max_wait: float,
+        target_latency: float,
+    ) -> None:
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.target_latency = target_latency
+
+        self.limit = float(max_limit)
+        self.latency = target_latency  # exponentially weighted moving average
+        self.inflight = 0
+        self.waiters: Deque[asyncio.Future] = deque()
+
+    async def acquire(self) -> bool:
+        """Wait for a free slot, or return False if the request should be shed"""
+        if self.inflight < int(self.limit) and not self.waiters:
+            self.inflight += 1
+            return True
+
+        if len(self.waiters) >= self.max_queue:
+            return False
+
+        future = asyncio.get_running_loop().create_future()
+        self.waiters.append(future)
+        try:
+            await asyncio.wait_for(future, self.max_wait)
+            return True
+        except asyncio.TimeoutError:
+            # the slot may have been handed over just as the wait timed out
+            return future.done() and not future.cancelled()
+        except asyncio.CancelledError:
+            # a slot handed over just before the client went away is passed on
+            if future.done() and not future.cancelled():
+                self.inflight -= 1
+                self.wake()
+            raise
+        finally:
+            if future in self.waiters:
+                self.waiters.remove(future)
+
+    def observe(self, latency: float) -> None:
+        """Adapt the limit to the latency of one upstream call"""
+        # NOTE: called from worker threads, so only updates numbers; the new
+        # limit is applied to waiting requests on the next release
+        self.latency = 0.8 * self.latency + 0.2 * latency
+
+        if self.latency > self.target_latency:
+            self.limit = max(self.min_limit, self.limit * 0.9)
+        else:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+    def release(self) -> None:
+        """Free the slot for the next waiting request"""
+        self.inflight -= 1
+        self.wake()
+
+    def wake(self) -> None:
+        """Hand free slots to waiting requests, oldest first"""
+        while self.waiters and self.inflight < int(self.limit):
+            future = self.waiters.popleft()
+            if not future.done():
+                self.inflight += 1
+                future.set_result(None)
+
+    def retry_after(self) -> int:
+        """Estimate the seconds until the queue has drained"""
+        return max(1, math.ceil(self.latency * (len(self.waiters) + 1) / self.limit))
+
+
+# limiter of the group the current request belongs to, also in worker threads
+current_limiter: ContextVar[Optional[AdaptiveLimiter]] = ContextVar(
+    "current_limiter", default=None
+)
+
+
+def observe_upstream(latency: float) -> None:
+    """Report the latency of an upstream call to the limiter of the request"""
+    limiter = current_limiter.get()
+    if limiter is not None:
+        limiter.observe(latency)
+
+
+class AdmissionControl:
+    """ASGI middleware that limits concurrent requests per group of routes
+
+    Routes are grouped on path prefix. Routes outside any group, e.g. /docs,
+    are never limited, and as waiting requests do not hold a worker thread,
+    a backlog on slow upstream routes cannot starve them.
+    """
+
+    def __init__(self, app: Callable, groups: Dict[str, AdaptiveLimiter]) -> None:
+        self.app = app
+        # longest prefix first, so nested groups take precedence
+        self.groups = dict(sorted(groups.items(), key=lambda g: -len(g[0])))
+
+    def match(self, path: str) -> Optional[AdaptiveLimiter]:
+        """Get the limiter of the group the path belongs to, if any"""
+        return next(
+            (
+                limiter
+                for prefix, limiter in self.groups.items()
+                if path == prefix or path.startswith(prefix.rstrip("/") + "/")
+            ),
+            None,
+        )
+
+    async def __call__(self, scope: dict, receive: Callable, send: Callable) -> Any:
+        """Admit, queue or reject the request"""
+        limiter = self.match(scope["path"]) if scope["type"] == "http" else None
+        if limiter is None:
+            return await self.app(scope, receive, send)
+
+        if not await limiter.acquire():
+            response = JSONResponse(
+                {"detail": "Service overloaded, please retry later"},
+                status_code=503,
+                headers={"Retry-After": str(limiter.retry_after())},
+            )
+            return await response(scope, receive, send)
+
+        context = current_limiter.set(limiter)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            current_limiter.reset(context)
+            limiter.release()
@@ -1,15 +1,15 @@
 from datetime import datetime, timezone
 from enum import Enum
-from os import getenv
-from typing import List, Optional
+from functools import lru_cache
+from typing import Iterator, List, Optional
 
 import requests
 from croniter import croniter
 from fastapi import HTTPException
 from pydantic import BaseModel, Field, validator
 
-HOST = f"http://{getenv('AIRFLOW_SERVER')}:8080/api/v1"
-AUTH = ("localhost", getenv("WP3API_AIRFLOW_PASS"))
+from api.settings import get_settings
+from api.utils.profiling import timed
 
 
 class PipelineHealth(Enum):
@@ -55,16 +55,27 @@ class PipelineRun(BaseModel):
     """Pipeline run status model"""
 
     start_date: Optional[datetime]
+    end_date: Optional[datetime]
     dag_run_id: str
     state: str
     health: PipelineHealth = PipelineHealth.UNKNOWN
     tasks: List[PipelineTask] = Field(default_factory=list)
 
 
+@lru_cache(maxsize=1)
+def airflow_session() -> requests.Session:
+    """Create an authenticated session with Airflow on first use"""
+    session = requests.Session()
+    session.auth = ("localhost", get_settings().airflow_pass)
+    return session
+
+
 def get_airflow(endpoint: str) -> dict:
     """Wrap requests for generalised Airflow GET requests"""
+    host = f"http://{get_settings().airflow_server}:8080/api/v1"
     try:
-        response = requests.get(HOST + endpoint, auth=AUTH)
+        with timed("airflow"):
+            response = airflow_session().get(host + endpoint)
     except requests.exceptions.ConnectionError as e:
         # Airflow server most likely not accessible
         raise HTTPException(
@@ -84,15 +95,18 @@ def get_dag_dagruns(dag_id: str, limit: int = 25, offset: int = 0) -> List[Pipel
     return [PipelineRun(**p) for p in payload]
 
 
-def get_all_dag_dagruns(dag_id: str) -> List[PipelineRun]:
-    """Get all possible dagruns from a particular dag_id"""
-    runs, offset, steps = [], 0, 100
+def iter_dag_dagruns(dag_id: str) -> Iterator[PipelineRun]:
+    """Get all possible dagruns from a particular dag_id, one page at a time"""
+    offset, steps = 0, 100
 
     while past_runs := get_dag_dagruns(dag_id, limit=steps, offset=offset):
-        runs.extend(past_runs)
+        yield from past_runs
         offset += steps
 
-    return runs
+
+def get_all_dag_dagruns(dag_id: str) -> List[PipelineRun]:
+    """Get all possible dagruns from a particular dag_id"""
+    return list(iter_dag_dagruns(dag_id))
 
 
 def get_dagrun_tasks(dag_id: str, dag_run_id: str) -> List[PipelineTask]:
@@ -0,0 +1,150 @@
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from statistics import quantiles
+from threading import Lock
+from typing import Dict, List, Optional
+
+from pydantic import BaseModel
+
+from api.utils.airflow import (
+    PipelineHealth,
+    PipelineRun,
+    get_dag_dagruns,
+    update_run_health,
+)
+
+# runs in these states will not change anymore, and can be kept
+FINISHED_STATES = ("success", "failed")
+HOTSPOTS = 5
+# runs that started before the largest window are not fetched, or dropped
+MAX_WINDOW_DAYS = 365
+MAX_WINDOWS = 5
+
+
+class DurationPercentiles(BaseModel):
+    """Run duration percentiles, in seconds"""
+
+    p50: Optional[float]
+    p90: Optional[float]
+    p99: Optional[float]
+
+
+class TaskFailures(BaseModel):
+    """Number of failures of a task"""
+
+    task_id: str
+    failures: int
+
+
+class PipelineAnalytics(BaseModel):
+    """Reliability of a pipeline over a rolling window"""
+
+    window_days: int
+    runs: int
+    green_rate: Optional[float]
+    orange_rate: Optional[float]
+    red_rate: Optional[float]
+    duration: DurationPercentiles
+    failure_hotspots: List[TaskFailures]
+
+
+class RunHistory:
+    """In-memory history of finished runs, synced incrementally with Airflow"""
+
+    def __init__(self) -> None:
+        self.runs: Dict[str, Dict[str, PipelineRun]] = {}
+        self.locks: Dict[str, Lock] = {}
+
+    def clear(self) -> None:
+        """Forget all runs, e.g. of a previously configured Airflow server"""
+        self.runs.clear()
+        self.locks.clear()
+
+    def sync(self, dag_id: str) -> List[PipelineRun]:
+        """Evaluate runs that are new since the last sync and return all finished runs"""
+        since = datetime.now(tz=timezone.utc) - timedelta(days=MAX_WINDOW_DAYS)
+
+        # NOTE: one lock per DAG, so a (cold) sync of one DAG does not block others
+        with self.locks.setdefault(dag_id, Lock()):
+            known = self.runs.setdefault(dag_id, {})
+            offset, steps = 0, 100
+
+            # runs are ordered newest first, so stop at the first page with known
+            # runs, or with runs older than the largest window
+            while page := get_dag_dagruns(dag_id, limit=steps, offset=offset):
+                new = [run for run in page if run.dag_run_id not in known]
+
+                for run in new:
+                    if run.state in FINISHED_STATES and started_since(run, since):
+                        update_run_health(dag_id, run)
+                        known[run.dag_run_id] = run
+
+                if len(new) < len(page) or not started_since(page[-1], since):
+                    break
+                offset += steps
+
+            for run_id in [
+                id for id, run in known.items() if not started_since(run, since)
+            ]:
+                del known[run_id]
+
+            return list(known.values())
+
+
+def started_since(run: PipelineRun, since: datetime) -> bool:
+    """Check if the run started after the given time"""
+    # NOTE: runs that have not started yet are newer by definition
+    return run.start_date is None or run.start_date >= since
+
+
+HISTORY = RunHistory()
+
+
+def rate(runs: List[PipelineRun], health: PipelineHealth) -> Optional[float]:
+    """Fraction of the runs with the given health"""
+    if not runs:
+        return None
+    return round(sum(run.health == health for run in runs) / len(runs), 3)
+
+
+def duration_percentiles(runs: List[PipelineRun]) -> DurationPercentiles:
+    """Calculate the 50th, 90th and 99th percentile of run durations"""
+    durations = [
+        (run.end_date - run.start_date).total_seconds()
+        for run in runs
+        if run.start_date and run.end_date
+    ]
+    if len(durations) < 2:
+        single = durations[0] if durations else None
+        return DurationPercentiles(p50=single, p90=single, p99=single)
+
+    cuts = quantiles(durations, n=100, method="inclusive")
+    return DurationPercentiles(p50=cuts[49], p90=cuts[89], p99=cuts[98])
+
+
+def failure_hotspots(runs: List[PipelineRun]) -> List[TaskFailures]:
+    """List the tasks that failed most often"""
+    # NOTE: 'upstream_failed' tasks are a consequence, not the cause, of a failure
+    failures = Counter(
+        task.task_id for run in runs for task in run.tasks if task.state == "failed"
+    )
+    return [
+        TaskFailures(task_id=task_id, failures=count)
+        for task_id, count in failures.most_common(HOTSPOTS)
+    ]
+
+
+def pipeline_analytics(runs: List[PipelineRun], window_days: int) -> PipelineAnalytics:
+    """Aggregate the reliability of the runs that started within the window"""
+    since = datetime.now(tz=timezone.utc) - timedelta(days=window_days)
+    recent = [run for run in runs if run.start_date and run.start_date >= since]
+
+    return PipelineAnalytics(
+        window_days=window_days,
+        runs=len(recent),
+        green_rate=rate(recent, PipelineHealth.GREEN),
+        orange_rate=rate(recent, PipelineHealth.ORANGE),
+        red_rate=rate(recent, PipelineHealth.RED),
+        duration=duration_percentiles(recent),
+        failure_hotspots=failure_hotspots(recent),
+    )
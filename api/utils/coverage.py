@@ -0,0 +1,157 @@
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from enum import Enum
+from functools import lru_cache
+from itertools import accumulate
+from typing import Dict, List, Tuple
+
+from pydantic.dataclasses import dataclass
+
+from api.utils.ucam import PatientWithDevices, fetch_roster
+
+
+class GROUPBY(Enum):
+    """Enum for grouping options of the coverage statistics"""
+
+    COHORT = "cohort"
+    DISEASE = "disease"
+
+
+@dataclass
+class DeviceCoverage:
+    """Day-binned wear coverage of one device type"""
+
+    start: date  # day of the first bin in `active`
+    active: List[int]  # participants wearing this device type, per day
+    participants: int
+    wear_days: int  # days worn, counted once per participant
+    overlap_days: int  # days a participant wore multiple devices of this type
+    gap_days: int  # days between first and last wear without any wearer
+    mean_active: float
+    peak_active: int
+
+
+class Intervals:
+    """Wear intervals of one device type, as day offsets"""
+
+    def __init__(self) -> None:
+        self.participant: List[str] = []
+        self.start: List[int] = []
+        self.end: List[int] = []  # exclusive
+
+    def append(self, participant: str, start: int, end: int) -> None:
+        """Add one wear interval"""
+        self.participant.append(participant)
+        self.start.append(start)
+        self.end.append(end)
+
+
+def group_key(patient: PatientWithDevices, groupby: GROUPBY) -> str:
+    """Return the group the patient belongs to"""
+    return patient.patient_id[0] if groupby == GROUPBY.COHORT else patient.disease.name
+
+
+def device_type(device_id: str) -> str:
+    """Derive the device type from the device ID, e.g. AX6-XXXX -> AX6"""
+    return device_id[:3].upper()
+
+
+def union_intervals(starts: List[int], ends: List[int]) -> Tuple[List[int], List[int]]:
+    """Merge overlapping [start, end) intervals"""
+    merged_starts: List[int] = []
+    merged_ends: List[int] = []
+    for start, end in sorted(zip(starts, ends)):
+        if merged_ends and start <= merged_ends[-1]:
+            merged_ends[-1] = max(merged_ends[-1], end)
+        else:
+            merged_starts.append(start)
+            merged_ends.append(end)
+    return merged_starts, merged_ends
+
+
+def coverage(intervals: Intervals, origin: date) -> DeviceCoverage:
+    """Compute day-binned coverage and summary statistics from the intervals
+
+    NOTE: this is plain Python, looping once over the intervals and once over
+    the days (a difference array and prefix sum), i.e. O(intervals + days).
+    Rosters are small enough that this does not warrant NumPy as a dependency.
+    """
+    # only the union of each participant's intervals counts towards `active`
+    by_participant: Dict[str, Tuple[List[int], List[int]]] = defaultdict(
+        lambda: ([], [])
+    )
+    for participant, start, end in zip(
+        intervals.participant, intervals.start, intervals.end
+    ):
+        by_participant[participant][0].append(start)
+        by_participant[participant][1].append(end)
+
+    starts: List[int] = []
+    ends: List[int] = []
+    for participant_starts, participant_ends in by_participant.values():
+        merged_starts, merged_ends = union_intervals(
+            participant_starts, participant_ends
+        )
+        starts.extend(merged_starts)
+        ends.extend(merged_ends)
+
+    first, last = min(starts), max(ends)
+
+    # difference array: +1 at each start, -1 at each end, then a prefix sum
+    delta = [0] * (last - first + 1)
+    for start in starts:
+        delta[start - first] += 1
+    for end in ends:
+        delta[end - first] -= 1
+    active = list(accumulate(delta[:-1]))
+
+    wear_days = sum(ends) - sum(starts)
+    total_days = sum(intervals.end) - sum(intervals.start)
+
+    return DeviceCoverage(  # type: ignore[call-arg]
+        start=origin + timedelta(days=first),
+        active=active,
+        participants=len(by_participant),
+        wear_days=wear_days,
+        overlap_days=total_days - wear_days,
+        gap_days=active.count(0),
+        mean_active=round(wear_days / len(active), 2) if active else 0.0,
+        peak_active=max(active, default=0),
+    )
+
+
+@lru_cache(maxsize=len(GROUPBY) * 2)
+def coverage_stats(
+    version: int, groupby: GROUPBY
+) -> Dict[str, Dict[str, DeviceCoverage]]:
+    """Get device coverage per group and device type for a roster snapshot"""
+    patients = fetch_roster(version).patients
+    today = datetime.utcnow().date()
+    origin = min(
+        (d.start_wear.date() for p in patients for d in p.devices),
+        default=today,
+    )
+
+    groups: Dict[str, Dict[str, Intervals]] = defaultdict(
+        lambda: defaultdict(Intervals)
+    )
+    for patient in patients:
+        for device in patient.devices:
+            # VTT entries do not have a device_id
+            if not device.device_id:
+                continue
+            end = device.end_wear.date() if device.end_wear else today
+            start_day = (device.start_wear.date() - origin).days
+            # end_wear is inclusive, the interval is not
+            end_day = max((end - origin).days + 1, start_day)
+            groups[group_key(patient, groupby)][device_type(device.device_id)].append(
+                patient.patient_id, start_day, end_day
+            )
+
+    return {
+        group: {
+            device: coverage(intervals, origin)
+            for device, intervals in sorted(devices.items())
+        }
+        for group, devices in sorted(groups.items())
+    }
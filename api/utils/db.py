@@ -1,22 +1,36 @@
-import os
+from functools import lru_cache
 from typing import Optional
 
-from dotenv import load_dotenv
 from pydantic.dataclasses import dataclass
 from pymongo import MongoClient
+from pymongo.collection import Collection
 
-load_dotenv()
+from api.settings import get_settings
+from api.utils.profiling import timed
 
-# setup mongodb connection
-myclient = MongoClient(
-    # host=[f"{os.getenv('_MONGO_HOST')}:27017"],
-    host=[f"{os.getenv('_MONGO_INITDB_HOST')}:{os.getenv('_MONGO_INITDB_PORT')}"],
-    # host=os.getenv("_MONGO_INITDB_HOST"),
-    username=os.getenv("_MONGO_INITDB_ROOT_USERNAME"),
-    password=os.getenv("_MONGO_INITDB_ROOT_PASSWORD"),
-)
-mydb = myclient[os.getenv("_MONGO_INITDB_DATABASE")]
-mycol = mydb[os.getenv("_MONGO_INITDB_COLLECTION")]
+
+@lru_cache(maxsize=1)
+def mongo_client() -> MongoClient:
+    """Set up the mongodb connection on first use"""
+    settings = get_settings()
+    return MongoClient(
+        host=[f"{settings.mongo_host}:{settings.mongo_port}"],
+        username=settings.mongo_username,
+        password=settings.mongo_password,
+    )
+
+
+def close_mongo_client() -> None:
+    """Close the mongodb connection, if it was ever set up"""
+    if mongo_client.cache_info().currsize:
+        mongo_client().close()
+    mongo_client.cache_clear()
+
+
+def credentials_collection() -> Collection:
+    """Get the collection holding the patient credentials"""
+    settings = get_settings()
+    return mongo_client()[settings.mongo_database][settings.mongo_collection]
 
 
 @dataclass
@@ -35,7 +49,9 @@ class PatientsCredentials:
 def get_patients_credentials(the_id: str) -> Optional[PatientsCredentials]:
     """Get credentials for one patient based on the ID"""
     myquery = {"patient_id": the_id}
-    payload = mycol.find_one(myquery, {"_id": 0})  # exclude _id from result
+    with timed("mongo"):
+        # exclude _id from result
+        payload = credentials_collection().find_one(myquery, {"_id": 0})
     if payload:
         patient_credentials = PatientsCredentials(**payload)
         return patient_credentials
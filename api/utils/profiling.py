@@ -0,0 +1,292 @@
+import asyncio
+import random
+import sys
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from functools import wraps
+from pathlib import Path
+from secrets import compare_digest
+from time import perf_counter
+from types import FrameType
+from typing import Any, Callable, Dict, Iterator, List, Optional
+from urllib.parse import parse_qs
+from uuid import uuid4
+
+from fastapi import FastAPI
+from fastapi.routing import APIRoute
+from pydantic import BaseModel
+from starlette.concurrency import run_in_threadpool
+
+from api.utils.admission import observe_upstream
+
+# set for the duration of a profiled request, also in its worker threads
+current_profile: ContextVar[Optional["Profile"]] = ContextVar(
+    "current_profile", default=None
+)
+
+
+class UpstreamTiming(BaseModel):
+    """Time spent in calls to one upstream service, in seconds"""
+
+    calls: int
+    total: float
+
+
+class ProfileSummary(BaseModel):
+    """Summary of a profiled request"""
+
+    id: str
+    method: str
+    path: str
+    started: datetime
+    duration: Optional[float]
+    status_code: Optional[int]
+
+
+class ProfileDetails(ProfileSummary):
+    """Profiled request with upstream timings and sampled stacks"""
+
+    upstream: Dict[str, UpstreamTiming]
+    # collapsed stacks ("outer;inner" -> samples), e.g. for flamegraphs
+    stacks: Dict[str, int]
+
+
+class Profile:
+    """Timings and stack samples collected for one request"""
+
+    def __init__(self, method: str, path: str) -> None:
+        self.id = uuid4().hex
+        self.method = method
+        self.path = path
+        self.started = datetime.now(tz=timezone.utc)
+        self.duration: Optional[float] = None
+        self.status_code: Optional[int] = None
+        self.upstream: Dict[str, List[float]] = {}
+        self.stacks: Counter = Counter()
+        # threads working for this request, counted per (nested) registration
+        self.threads: Counter = Counter()
+        self.lock = threading.Lock()
+
+    def details(self) -> ProfileDetails:
+        """Get the full profile"""
+        return ProfileDetails(
+            id=self.id,
+            method=self.method,
+            path=self.path,
+            started=self.started,
+            duration=self.duration,
+            status_code=self.status_code,
+            upstream={
+                kind: UpstreamTiming(calls=len(took), total=round(sum(took), 4))
+                for kind, took in self.upstream.items()
+            },
+            stacks=dict(self.stacks.most_common()),
+        )
+
+
+@contextmanager
+def profiled_thread() -> Iterator[None]:
+    """Sample the current thread while in this block, if the request is profiled"""
+    profile = current_profile.get()
+    if profile is None:
+        yield
+        return
+
+    ident = threading.get_ident()
+    with profile.lock:
+        profile.threads[ident] += 1
+    try:
+        yield
+    finally:
+        with profile.lock:
+            profile.threads[ident] -= 1
+            if not profile.threads[ident]:
+                del profile.threads[ident]
+
+
+@contextmanager
+def timed(kind: str) -> Iterator[None]:
+    """Record the time of an upstream call for admission control and profiling"""
+    start = perf_counter()
+    try:
+        with profiled_thread():
+            yield
+    finally:
+        took = perf_counter() - start
+        observe_upstream(took)
+
+        profile = current_profile.get()
+        if profile is not None:
+            profile.upstream.setdefault(kind, []).append(took)
+
+
+def profile_endpoints(app: FastAPI) -> None:
+    """Sample the worker threads that run the (sync) endpoints of profiled requests"""
+    for route in app.routes:
+        if not isinstance(route, APIRoute):
+            continue
+        call = route.dependant.call
+        if call is None or asyncio.iscoroutinefunction(call):
+            continue
+
+        def sampled(*args: Any, endpoint: Callable = call, **kwargs: Any) -> Any:
+            with profiled_thread():
+                return endpoint(*args, **kwargs)
+
+        # NOTE: FastAPI looks up dependant.call on every request
+        route.dependant.call = wraps(call)(sampled)
+
+
+def collapse(frame: Optional[FrameType]) -> str:
+    """Collapse a stack into 'outer;...;inner' function names"""
+    names: List[str] = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({code.co_filename}:{frame.f_lineno})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class Sampler(threading.Thread):
+    """Periodically sample the stacks of the threads working for one request
+
+    NOTE: these are the worker thread running the endpoint and any thread
+    making upstream calls for it (see profiled_thread), not the event loop.
+    """
+
+    def __init__(self, profile: Profile, interval: float) -> None:
+        super().__init__(daemon=True)
+        self.profile = profile
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def run(self) -> None:
+        """Sample until stopped"""
+        while not self.stopped.wait(self.interval):
+            with self.profile.lock:
+                idents = list(self.profile.threads)
+            frames = sys._current_frames()
+            for ident in idents:
+                if ident in frames:
+                    self.profile.stacks[collapse(frames[ident])] += 1
+
+    def stop(self) -> None:
+        """Stop sampling and wait for the last sample"""
+        self.stopped.set()
+        self.join()
+
+
+class ProfileStore:
+    """The last profiles, stored in a directory shared by all workers"""
+
+    def __init__(self, directory: Path, keep: int) -> None:
+        self.directory = directory
+        self.keep = keep
+
+    def files(self) -> List[Path]:
+        """List stored profiles, newest first"""
+        if not self.directory.is_dir():
+            return []
+        return sorted(
+            self.directory.glob("*.json"), key=lambda f: f.stat().st_mtime, reverse=True
+        )
+
+    def add(self, profile: Profile) -> None:
+        """Store a finished profile, dropping the oldest"""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        # write to a temporary file first, so other workers never read half a profile
+        temporary = self.directory / f"{profile.id}.tmp"
+        temporary.write_text(profile.details().json())
+        temporary.replace(self.directory / f"{profile.id}.json")
+
+        for old in self.files()[self.keep :]:
+            old.unlink(missing_ok=True)
+
+    def all(self) -> List[ProfileDetails]:
+        """Get all stored profiles"""
+        profiles = []
+        for file in self.files():
+            try:
+                profiles.append(ProfileDetails.parse_file(file))
+            except FileNotFoundError:
+                # removed by another worker in the meantime
+                continue
+        return profiles
+
+    def get(self, id: str) -> Optional[ProfileDetails]:
+        """Get one profile by its ID"""
+        file = self.directory / f"{id}.json"
+        return ProfileDetails.parse_file(file) if file.is_file() else None
+
+
+def authorised(token: Optional[str], given: Optional[str]) -> bool:
+    """Check the given token against the configured profiling token"""
+    return bool(token and given and compare_digest(token, given))
+
+
+class Profiling:
+    """ASGI middleware to profile requests on demand
+
+    A request is profiled if it has the `profile` query flag and carries the
+    profiling token in the `X-Profile-Token` header, or if it is randomly
+    sampled at `sample_rate`. The token is never accepted as query parameter,
+    to keep it out of access logs.
+    """
+
+    def __init__(
+        self,
+        app: Callable,
+        store: ProfileStore,
+        token: str,
+        sample_rate: float,
+        interval: float,
+    ) -> None:
+        self.app = app
+        self.store = store
+        self.token = token
+        self.sample_rate = sample_rate
+        self.interval = interval
+
+    def wanted(self, scope: dict) -> bool:
+        """Check if this request should be profiled"""
+        if self.sample_rate and random.random() < self.sample_rate:  # noqa: S311
+            return True
+
+        query = parse_qs(scope["query_string"].decode(), keep_blank_values=True)
+        if "profile" not in query:
+            return False
+
+        headers = dict(scope["headers"])
+        given = headers.get(b"x-profile-token", b"").decode("latin-1")
+        return authorised(self.token, given)
+
+    async def __call__(self, scope: dict, receive: Callable, send: Callable) -> Any:
+        """Profile the request, if asked to"""
+        if scope["type"] != "http" or not self.wanted(scope):
+            return await self.app(scope, receive, send)
+
+        profile = Profile(scope["method"], scope["path"])
+
+        async def send_with_id(message: dict) -> None:
+            if message["type"] == "http.response.start":
+                profile.status_code = message["status"]
+                message["headers"] = [
+                    *message.get("headers", []),
+                    (b"x-profile-id", profile.id.encode()),
+                ]
+            await send(message)
+
+        context = current_profile.set(profile)
+        sampler = Sampler(profile, self.interval)
+        sampler.start()
+        start = perf_counter()
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            profile.duration = round(perf_counter() - start, 4)
+            sampler.stop()
+            current_profile.reset(context)
+            await run_in_threadpool(self.store.add, profile)
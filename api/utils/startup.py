@@ -0,0 +1,27 @@
+import logging
+from contextlib import contextmanager
+from time import perf_counter
+from typing import Dict, Iterator
+
+logger = logging.getLogger("uvicorn.error")
+
+
+class StartupReport:
+    """Time spent per stage of creating and starting the API, in seconds"""
+
+    def __init__(self) -> None:
+        self.stages: Dict[str, float] = {}
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """Time the enclosed block as one stage"""
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = round(perf_counter() - start, 4)
+
+    def log(self) -> None:
+        """Log the duration of each stage, and the total"""
+        stages = ", ".join(f"{name}={took:.4f}s" for name, took in self.stages.items())
+        logger.info(f"Startup took {sum(self.stages.values()):.4f}s ({stages})")
@@ -0,0 +1,136 @@
+import codecs
+import json
+import re
+from dataclasses import asdict, is_dataclass
+from itertools import chain
+from typing import Any, Iterable, Iterator, Optional
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+from starlette.datastructures import Headers
+from starlette.middleware.gzip import GZipMiddleware, GZipResponder
+
+NDJSON = "application/x-ndjson"
+COMPRESSIBLE = ("application/json", NDJSON)
+WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+
+def wants_ndjson(accept: Optional[str]) -> bool:
+    """Check if the client asked for newline delimited JSON"""
+    return bool(accept) and NDJSON in accept
+
+
+def ndjson_line(item: Any) -> str:
+    """Encode one item as a line of JSON"""
+    # NOTE: jsonable_encoder does not encode the fields of dataclasses
+    return json.dumps(jsonable_encoder(asdict(item) if is_dataclass(item) else item))
+
+
+def ndjson_response(items: Iterable[Any]) -> StreamingResponse:
+    """Stream items as newline delimited JSON, one item per line"""
+    items = iter(items)
+    # NOTE: get the first item before responding, so upstream errors
+    # (e.g. a failing connection) still result in the right status code
+    first = next(items, None)
+    lines = (
+        ndjson_line(item) + "\n"
+        for item in (chain([first], items) if first is not None else [])
+    )
+    return StreamingResponse(lines, media_type=NDJSON)
+
+
+def iter_json_array(chunks: Iterable[bytes]) -> Iterator[Any]:
+    """
+    Parse the items of a top-level JSON array while its body is received
+
+    Only the current item and the unparsed rest of the last chunk are held in
+    memory, rather than the whole body and all its items. A top-level null is
+    read as an empty array.
+
+    NOTE: an item is parsed again as each of its chunks arrives, so keep
+    chunks large compared to the items
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    buffer = ""
+    expect = "start"  # start, first, item, separator or end
+
+    final_chunk = [(b"", True)]
+    for chunk, final in chain(((chunk, False) for chunk in chunks), final_chunk):
+        buffer += utf8.decode(chunk, final)
+        pos = 0
+        while True:
+            pos = WHITESPACE.match(buffer, pos).end()  # type: ignore[union-attr]
+            if pos == len(buffer):
+                break
+
+            if expect == "start" and buffer[pos] == "n":
+                if len(buffer) - pos < 4 and not final:
+                    break
+                if buffer[pos : pos + 4] != "null":
+                    raise json.JSONDecodeError("Expecting array", buffer, pos)
+                expect, pos = "end", pos + 4
+            elif expect == "start":
+                if buffer[pos] != "[":
+                    raise json.JSONDecodeError("Expecting array", buffer, pos)
+                expect, pos = "first", pos + 1
+            elif expect == "first" and buffer[pos] == "]":
+                expect, pos = "end", pos + 1
+            elif expect in ("first", "item"):
+                try:
+                    item, end = decoder.raw_decode(buffer, pos)
+                except json.JSONDecodeError:
+                    if final:
+                        raise
+                    break
+                # NOTE: only complete if followed by a separator, as numbers at
+                # the end of the buffer (e.g. "12.") may continue in the next chunk
+                after = WHITESPACE.match(buffer, end).end()  # type: ignore[union-attr]
+                if not final and (after == len(buffer) or buffer[after] not in ",]"):
+                    break
+                yield item
+                expect, pos = "separator", end
+            elif expect == "separator" and buffer[pos] in ",]":
+                expect, pos = "item" if buffer[pos] == "," else "end", pos + 1
+            else:
+                raise json.JSONDecodeError("Unexpected data", buffer, pos)
+
+        buffer = buffer[pos:]
+
+    if expect != "end":
+        raise json.JSONDecodeError("Incomplete array", buffer, len(buffer))
+
+
+class JSONGZipResponder(GZipResponder):
+    """Compress JSON responses only, and leave encoded responses as is"""
+
+    passthrough = False
+
+    async def send_with_gzip(self, message: dict) -> None:
+        """Decide on compression based on the response headers"""
+        if message["type"] == "http.response.start":
+            headers = Headers(raw=message["headers"])
+            self.passthrough = "content-encoding" in headers or not headers.get(
+                "content-type", ""
+            ).startswith(COMPRESSIBLE)
+
+        if self.passthrough:
+            await self.send(message)
+        else:
+            await super().send_with_gzip(message)
+
+
+class JSONGZip(GZipMiddleware):
+    """GZip middleware that only compresses JSON and NDJSON bodies"""
+
+    async def __call__(self, scope: dict, receive: Any, send: Any) -> None:
+        """Compress the response if the client accepts gzip"""
+        if scope["type"] == "http" and "gzip" in Headers(scope=scope).get(
+            "accept-encoding", ""
+        ):
+            responder = JSONGZipResponder(
+                self.app, self.minimum_size, compresslevel=self.compresslevel
+            )
+            await responder(scope, receive, send)
+            return
+        await self.app(scope, receive, send)
@@ -1,13 +1,28 @@
 from __future__ import annotations
 
-import os
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextvars import copy_context
 from datetime import datetime
 from enum import IntEnum
-from typing import List, Optional
+from functools import lru_cache
+from time import time
+from typing import Dict, Iterator, List, NamedTuple, Optional
 
 import requests
+from fastapi import HTTPException
 from pydantic.dataclasses import dataclass
 
+from api.settings import get_settings
+from api.utils.profiling import timed
+from api.utils.streaming import iter_json_array
+
+# upper bound on IDs per batch, as IDs missing from the roster each cost a request
+MAX_BATCH_SIZE = 500
+# bytes of the /patients body to parse at once
+UCAM_CHUNK_SIZE = 64 * 1024
+# statuses of UCAM for a patient ID it does not know (besides 204) or cannot parse
+UNKNOWN_ID_STATUSES = (400, 404)
+
 
 class DiseaseType(IntEnum):
     """Enum for disease types"""
@@ -122,28 +137,45 @@ def format_weartime(time: str) -> datetime:
     return datetime.strptime(time, "%Y-%m-%dT%H:%M:%S")
 
 
+@lru_cache(maxsize=1)
+def ucam_session() -> requests.Session:
+    """Create a session with UCAM on first use, reusing its connections"""
+    return requests.Session()
+
+
+@lru_cache(maxsize=1)
+def ucam_login(
+    uri: str, username: Optional[str], password: Optional[str], period: int
+) -> str:
+    """Obtain an access token, once per set of credentials and period"""
+    request = {"Username": username, "Password": password}
+
+    response = ucam_session().post(f"{uri}/user/login", json=request)
+    response.raise_for_status()
+    result: dict = response.json()
+    access_token: str = result["token"]
+    return access_token
+
+
 def ucam_access_token() -> str:
     """Obtain (or refresh) an access token."""
-    now = int(datetime.utcnow().timestamp())
-    last_created = int(os.getenv("UCAM_ACCESS_TOKEN_GEN_TIME", 0))
+    settings = get_settings()
     # Refresh the token every 1 day, i.e., below 7 day limit.
-    token_expired = (last_created + (60 * 60 * 24)) <= now
-
-    if token_expired:
-        request = {
-            "Username": os.getenv("UCAM_USERNAME"),
-            "Password": os.getenv("UCAM_PASSWORD"),
-        }
+    period = int(time() // (60 * 60 * 24))
+    return ucam_login(
+        settings.ucam_uri, settings.ucam_username, settings.ucam_password, period
+    )
 
-        response = requests.post(f"{os.getenv('UCAM_URI')}/user/login", json=request)
-        response.raise_for_status()
-        result: dict = response.json()
-        access_token = result["token"]
 
-        os.environ["UCAM_ACCESS_TOKEN"] = access_token
-        os.environ["UCAM_ACCESS_TOKEN_GEN_TIME"] = str(now)
+def ucam_get(request_url: str, stream: bool = False) -> requests.Response:
+    """Perform GET request on the UCAM API, optionally leaving the body unread"""
+    url = f"{get_settings().ucam_uri}{request_url}"
 
-    return os.getenv("UCAM_ACCESS_TOKEN")
+    with timed("ucam"):
+        headers = {"Authorization": f"Bearer {ucam_access_token()}"}
+        response = ucam_session().get(url, headers=headers, stream=stream)
+    response.raise_for_status()
+    return response
 
 
 def response(request_url: str) -> Optional[dict]:
@@ -152,11 +184,7 @@ def response(request_url: str) -> Optional[dict]:
 
     NOTE: requests automatically converts null to None
     """
-    headers = {"Authorization": f"Bearer {ucam_access_token()}"}
-    url = f"{os.getenv('UCAM_URI')}{request_url}"
-
-    response = requests.get(url, headers=headers)
-    response.raise_for_status()
+    response = ucam_get(request_url)
 
     # possibly no result
     if response.status_code == 204:
@@ -166,15 +194,48 @@ def response(request_url: str) -> Optional[dict]:
     return result
 
 
+def iter_patients() -> Iterator[PatientWithDevices]:
+    """Get all patients known to UCAM, parsed one by one while received"""
+    response = ucam_get("/patients/", stream=True)
+
+    def parse() -> Iterator[PatientWithDevices]:
+        # NOTE: closing returns the connection, also when not read until the end
+        with response:
+            # NOTE: patients/patient_id returns a 204 if not found, other endpoints []
+            if response.status_code == 204:
+                return
+            payload = iter_json_array(response.iter_content(UCAM_CHUNK_SIZE))
+            for patient in payload:
+                yield PatientWithDevices.serialize(patient)
+
+    return parse()
+
+
 def get_patients() -> Optional[List[PatientWithDevices]]:
     """Get all patients known to UCAM"""
-    # NOTE: patients/patient_id returns a 204 if not found, other endpoints []
-    payload = response("/patients/")
-    return (
-        [PatientWithDevices.serialize(patient) for patient in payload]
-        if payload
-        else None
-    )
+    return list(iter_patients()) or None
+
+
+class Roster(NamedTuple):
+    """Snapshot of all patients known to UCAM"""
+
+    version: int
+    patients: List[PatientWithDevices]
+
+
+@lru_cache(maxsize=1)
+def fetch_roster(version: int) -> Roster:
+    """Fetch all patients once per version, i.e. per TTL window"""
+    patients = get_patients()
+    # NOTE: raising ensures an empty (or failed) fetch is not cached
+    if not patients:
+        raise HTTPException(status_code=502, detail="No patients returned by UCAM")
+    return Roster(version=version, patients=patients)
+
+
+def get_roster() -> Roster:
+    """Get the cached roster of patients, refreshed every ucam_roster_ttl seconds"""
+    return fetch_roster(int(time() // get_settings().ucam_roster_ttl))
 
 
 def get_one_patient(patient_id: str) -> Optional[PatientWithDevices]:
@@ -184,6 +245,64 @@ def get_one_patient(patient_id: str) -> Optional[PatientWithDevices]:
     return PatientWithDevices.serialize(payload) if payload else None
 
 
+def find_one_patient(patient_id: str) -> Optional[PatientWithDevices]:
+    """Get one patient, or None if UCAM does not know or rejects the ID"""
+    try:
+        return get_one_patient(patient_id)
+    except requests.HTTPError as e:
+        status_code = e.response.status_code if e.response is not None else None
+        # an unknown or malformed ID; other errors (e.g. auth, rate limits) are raised
+        if status_code in UNKNOWN_ID_STATUSES:
+            return None
+        if status_code == 401:
+            # the cached access token may have expired, so log in again next time
+            ucam_login.cache_clear()
+        raise
+
+
+@dataclass
+class PatientsBatch:
+    """Patients found for a list of IDs, and the IDs that were not found"""
+
+    patients: List[PatientWithDevices]
+    missing: List[str]
+
+
+def get_many_patients(patient_ids: List[str]) -> PatientsBatch:
+    """Get patients for many IDs, using the cached roster where possible"""
+    # drop duplicates, but keep the requested order
+    patient_ids = list(dict.fromkeys(patient_ids))
+    if len(patient_ids) > MAX_BATCH_SIZE:
+        raise HTTPException(
+            status_code=422, detail=f"At most {MAX_BATCH_SIZE} IDs per request"
+        )
+
+    try:
+        roster = {p.patient_id: p for p in get_roster().patients}
+    except HTTPException:
+        # no roster available, look up all patients directly
+        roster = {}
+    found: Dict[str, Optional[PatientWithDevices]] = {
+        id: roster[id] for id in patient_ids if id in roster
+    }
+
+    # participants enrolled since the roster was cached are looked up directly
+    misses = [id for id in patient_ids if id not in found]
+    if misses:
+        with ThreadPoolExecutor(max_workers=min(len(misses), 8)) as executor:
+            # NOTE: copy the context, so lookups count towards admission and profiles
+            lookups: List[Future[Optional[PatientWithDevices]]] = [
+                executor.submit(copy_context().run, find_one_patient, id)
+                for id in misses
+            ]
+            found.update(zip(misses, (lookup.result() for lookup in lookups)))
+
+    return PatientsBatch(  # type: ignore[call-arg]
+        patients=[found[id] for id in patient_ids if found[id]],
+        missing=[id for id in patient_ids if not found[id]],
+    )
+
+
 def get_devices(device_id: str = "") -> Optional[List[DeviceWithPatients]]:
     """Get one device based on the ID"""
     # always returns a list, even for one device_id
@@ -0,0 +1,147 @@
+import asyncio
+from typing import Iterator
+
+import pytest
+
+from api.utils.admission import AdaptiveLimiter, current_limiter, observe_upstream
+
+
+def limiter(
+    max_limit: int = 1, max_queue: int = 1, max_wait: float = 1
+) -> AdaptiveLimiter:
+    """Create a limiter with a healthy upstream latency"""
+    return AdaptiveLimiter(
+        min_limit=1,
+        max_limit=max_limit,
+        max_queue=max_queue,
+        max_wait=max_wait,
+        target_latency=1,
+    )
+
+
+def test_acquire_within_limit() -> None:
+    """Requests are admitted immediately up to the limit"""
+    lim = limiter(max_limit=2)
+
+    result = asyncio.run(asyncio.wait_for(lim.acquire(), 1))
+
+    assert result is True
+    assert lim.inflight == 1
+
+
+def test_queued_request_gets_released_slot() -> None:
+    """A waiting request is admitted once a slot is released"""
+    lim = limiter()
+
+    async def scenario() -> bool:
+        await lim.acquire()
+        waiter = asyncio.create_task(lim.acquire())
+        await asyncio.sleep(0)
+        lim.release()
+        return await waiter
+
+    result = asyncio.run(scenario())
+
+    assert result is True
+    assert lim.inflight == 1
+    assert not lim.waiters
+
+
+def test_full_queue_is_shed() -> None:
+    """Requests beyond the wait queue are rejected straight away"""
+    lim = limiter(max_queue=1)
+
+    async def scenario() -> bool:
+        await lim.acquire()
+        waiter = asyncio.create_task(lim.acquire())
+        await asyncio.sleep(0)
+        shed = await lim.acquire()
+        waiter.cancel()
+        return shed
+
+    result = asyncio.run(scenario())
+
+    assert result is False
+
+
+def test_wait_times_out() -> None:
+    """A request waiting longer than max_wait is rejected"""
+    lim = limiter(max_wait=0.01)
+
+    async def scenario() -> bool:
+        await lim.acquire()
+        return await lim.acquire()
+
+    result = asyncio.run(scenario())
+
+    assert result is False
+    assert lim.inflight == 1
+    assert not lim.waiters
+
+
+def test_cancelled_waiter_leaves_queue() -> None:
+    """A client going away while waiting does not keep its place in the queue"""
+    lim = limiter()
+
+    async def scenario() -> None:
+        await lim.acquire()
+        waiter = asyncio.create_task(lim.acquire())
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+
+    asyncio.run(scenario())  # act
+
+    assert lim.inflight == 1
+    assert not lim.waiters
+
+
+def test_cancelled_waiter_passes_on_handed_over_slot() -> None:
+    """A slot handed to a waiter that is then cancelled is not lost"""
+    lim = limiter(max_queue=2)
+
+    async def scenario() -> bool:
+        await lim.acquire()
+        first = asyncio.create_task(lim.acquire())
+        second = asyncio.create_task(lim.acquire())
+        await asyncio.sleep(0)
+        lim.release()  # hands the slot to `first`, which has not resumed yet
+        first.cancel()
+        (kept,) = await asyncio.gather(first, return_exceptions=True)
+        if kept is True:
+            # wait_for may return the handed over slot despite the cancellation
+            lim.release()
+        return await second
+
+    result = asyncio.run(scenario())
+
+    assert result is True
+    assert lim.inflight == 1
+
+
+@pytest.fixture
+def request_limiter() -> Iterator[AdaptiveLimiter]:
+    """Set the limiter of the current request, as AdmissionControl does"""
+    lim = limiter(max_limit=8)
+    token = current_limiter.set(lim)
+    yield lim
+    current_limiter.reset(token)
+
+
+def test_slow_upstream_shrinks_limit(request_limiter: AdaptiveLimiter) -> None:
+    """Upstream calls slower than the target latency reduce the limit"""
+    for _ in range(20):  # act
+        observe_upstream(10)
+
+    assert request_limiter.limit == request_limiter.min_limit
+
+
+def test_fast_upstream_grows_limit() -> None:
+    """The limit recovers once upstream calls are fast again"""
+    lim = limiter(max_limit=8)
+    lim.limit = 1
+
+    for _ in range(100):  # act
+        lim.observe(0.1)
+
+    assert lim.limit > 1
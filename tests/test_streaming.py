@@ -0,0 +1,48 @@
+import json
+
+import pytest
+
+from api.utils.streaming import iter_json_array
+
+PAYLOAD = [{"subject_id": "K-ABCDEF", "devices": [{"id": "é"}]}, 12.5, None, [1, 2]]
+
+
+def chunked(body: bytes, size: int) -> list:
+    """Split a body into chunks of at most size bytes"""
+    return [body[i : i + size] for i in range(0, len(body), size)]
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 1024])
+def test_items_split_across_chunks(size: int) -> None:
+    """Items are parsed whole, wherever the chunks split them"""
+    body = json.dumps(PAYLOAD, ensure_ascii=False, indent=1).encode()
+
+    result = list(iter_json_array(chunked(body, size)))
+
+    assert result == PAYLOAD
+
+
+@pytest.mark.parametrize("body", [b"[]", b" [ ] ", b"null"])
+def test_empty_arrays(body: bytes) -> None:
+    """An empty array and null have no items"""
+    result = list(iter_json_array(chunked(body, 1)))
+
+    assert result == []
+
+
+def test_items_are_parsed_while_received() -> None:
+    """An item is returned before later chunks are read"""
+    chunks = iter([b'[{"a": 1}, ', b'{"b": 2}]'])
+    items = iter_json_array(chunks)
+
+    result = next(items)
+
+    assert result == {"a": 1}
+    assert next(chunks) == b'{"b": 2}]'
+
+
+@pytest.mark.parametrize("body", [b"", b"{}", b"[1, 2", b"[1 2]", b"[1], 2", b"nul"])
+def test_invalid_arrays(body: bytes) -> None:
+    """Anything but one complete array raises"""
+    with pytest.raises(json.JSONDecodeError):
+        list(iter_json_array(chunked(body, 2)))